@@ -3,25 +3,74 @@
 # Prompt Styler + Recode 4.0 — Pro (stateful, virality rating, copy)
 # -------------------------------------------------------------------
 
-import os, re, io, json
+import os, re, io, csv, json, math, string, asyncio, hashlib, functools
 from typing import List, Dict, Any
 import streamlit as st
 from PIL import Image, ImageDraw, ImageFont
-from streamlit.components.v1 import html as st_html
 
 # Optional OpenAI (only used in "Recode Then Style")
 try:
-    from openai import OpenAI
+    import httpx
+    from openai import OpenAI, AsyncOpenAI
 except Exception:
+    httpx = None
     OpenAI = None
+    AsyncOpenAI = None
+
+# numpy ships with the app (requirements.txt) and vectorizes the analyzer's
+# per-character scan; guarded anyway so the heuristics degrade gracefully.
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Optional orjson (faster JSON pack export; stdlib json is the fallback)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Optional diskcache: persists recode responses across app restarts so a
+# redeploy doesn't re-bill prompts the in-process cache already answered.
+try:
+    import diskcache
+    _disk_cache = diskcache.Cache(".recode_cache")
+except Exception:
+    _disk_cache = None
 
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY) if (OpenAI and OPENAI_API_KEY) else None
+@st.cache_resource(show_spinner=False)
+def _get_client():
+    """Sync client with an explicit keep-alive pool. cache_resource keeps the
+    same client (and its warm TCP+TLS connections) across script reruns."""
+    if not (OpenAI and OPENAI_API_KEY):
+        return None
+    return OpenAI(
+        api_key=OPENAI_API_KEY,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=30),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        ),
+    )
+
+client = _get_client()
+
+# Cap concurrent batch requests so we stay under OpenAI rate limits
+BATCH_CONCURRENCY = 20
+
+def _make_async_client():
+    """Async client with an explicit bounded keep-alive pool, shared by all
+    calls of one batch run. Built per asyncio.run() so its connections live
+    on the right event loop."""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=30),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
 
 # --------------------------- UI THEME ---------------------------
-st.set_page_config(page_title="Prompt Styler + Recode 4.0 — Pro", page_icon="✨", layout="wide")
-st.markdown("""
+_CSS = """
 <style>
 body, .stApp { background:#fff !important; color:#111 !important; font-family:Inter,ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif; }
 h1,h2,h3,h4 { color:#2b2b6e; font-weight:700; }
@@ -33,12 +82,15 @@ hr { border:none; height:1px; background:#eee; margin:16px 0; }
 .card { background:#fafafa; border:1px solid #eee; border-radius:14px; padding:14px 16px; box-shadow:0 2px 4px rgba(0,0,0,.04); margin-bottom:12px; }
 .metric { display:flex; gap:10px; flex-wrap:wrap; }
 .metric .pill { background:#fff; border:1px solid #eee; border-radius:999px; padding:6px 12px; font-weight:600; box-shadow:0 1px 2px rgba(0,0,0,.03); }
-.copywrap { margin-top:8px; }
-.copybtn { background:#111; color:#fff; border:none; padding:8px 12px; border-radius:10px; font-weight:700; }
-.copybtn:hover { opacity:.9; }
 .stAlert { background:#ffecec !important; border:1px solid #f5b5b5 !important; border-radius:12px !important; }
 </style>
-""", unsafe_allow_html=True)
+"""
+# Minified once at import; the markdown call itself must run every rerun or
+# Streamlit drops the <style> element from the page.
+_CSS_MIN = re.sub(r"\s+", " ", _CSS).strip()
+
+st.set_page_config(page_title="Prompt Styler + Recode 4.0 — Pro", page_icon="✨", layout="wide")
+st.markdown(_CSS_MIN, unsafe_allow_html=True)
 
 # --------------------------- PRESETS ---------------------------
 EMOJI_MAP = {
@@ -65,6 +117,7 @@ STYLE_PRESETS = {
     "Ribbon Headline":     {"case":"title",    "prefix":"🏷️ ",  "bullets":False},
     "Headline Stack":      {"case":"title",    "prefix":"",     "bullets":False},
 }
+_STYLE_KEYS = tuple(STYLE_PRESETS)
 
 def _to_case(text: str, mode: str) -> str:
     if mode == "upper": return text.upper()
@@ -74,9 +127,10 @@ def _to_case(text: str, mode: str) -> str:
         return (t[:1].upper() + t[1:]) if t else t
     return text  # mixed
 
+_SPLIT_RE = re.compile(r"[.,;:!?]\s+|\s{2,}")
+
 def _smart_lines(core: str, max_lines: int = 5) -> List[str]:
-    parts = re.split(r"[.,;:!?]\s+|\s{2,}", core.strip())
-    parts = [p.strip() for p in parts if p.strip()]
+    parts = [p for p in (s.strip() for s in _SPLIT_RE.split(core.strip())) if p]
     if len(parts) < 3:
         words = core.split()
         if not words:
@@ -85,6 +139,7 @@ def _smart_lines(core: str, max_lines: int = 5) -> List[str]:
         parts = [" ".join(words[i:i+step]) for i in range(0, len(words), step)]
     return parts[:max_lines]
 
+@st.cache_data(max_entries=1024, show_spinner=False)
 def format_prompt_for_style(text: str, preset_name: str) -> str:
     p = STYLE_PRESETS[preset_name]
     if p["bullets"]:
@@ -114,13 +169,44 @@ DISRUPT_PATTERNS = [
     r"[!?]{2,}",
 ]
 
+# Both categories fused into one alternation compiled at import, so scoring is
+# a single linear pass over the text; matches are tallied by which named group
+# fired. IGNORECASE lets analyze_text skip allocating a lowercased copy.
+# The vocabularies are disjoint, so fusing cannot steal a hit from either side.
+_SCORE_RE = re.compile(
+    "(?P<tox>" + "|".join(TOXIC_PATTERNS) + ")|(?P<dis>" + "|".join(DISRUPT_PATTERNS) + ")",
+    re.IGNORECASE,
+)
+
+# Deletion tables: translate(None, table) keeps only the named class, all in C.
+_NOT_UPPER = bytes(i for i in range(256) if not 65 <= i <= 90)
+_NOT_LOWER = bytes(i for i in range(256) if not 97 <= i <= 122)
+
+def _char_counts(text: str):
+    """(letters, caps, exclam) — vectorized over the ASCII bytes when numpy
+    is available, otherwise bytes.translate passes (still C-level). For short
+    prompts the numpy call overhead exceeds the scan itself, so the translate
+    path handles anything under ~512 bytes."""
+    raw = text.encode("ascii", "ignore")
+    if np is not None and len(raw) > 512:
+        arr = np.frombuffer(raw, dtype=np.uint8)
+        caps = int(((arr >= 65) & (arr <= 90)).sum())
+        letters = caps + int(((arr >= 97) & (arr <= 122)).sum())
+        return letters, caps, int((arr == 33).sum())
+    caps = len(raw.translate(None, _NOT_UPPER))
+    letters = caps + len(raw.translate(None, _NOT_LOWER))
+    return letters, caps, raw.count(b"!")
+
+@st.cache_data(max_entries=1024, show_spinner=False)
 def analyze_text(text: str) -> Dict[str, int]:
-    t = text.lower()
-    tox_hits = sum(len(re.findall(p, t)) for p in TOXIC_PATTERNS)
-    dis_hits = sum(len(re.findall(p, t)) for p in DISRUPT_PATTERNS)
-    exclam = t.count("!")
-    letters = sum(1 for c in text if c.isalpha())
-    caps_ratio = sum(1 for c in text if c.isupper()) / letters if letters else 0
+    tox_hits = dis_hits = 0
+    for m in _SCORE_RE.finditer(text):
+        if m.lastgroup == "tox":
+            tox_hits += 1
+        else:
+            dis_hits += 1
+    letters, caps, exclam = _char_counts(text)
+    caps_ratio = caps / letters if letters else 0
     toxicity = int(min(100, tox_hits*10 + exclam*2 + caps_ratio*15))
     disruption = int(min(100, dis_hits*10 + caps_ratio*10))
     positivity = int(max(0, 100 - toxicity))
@@ -129,29 +215,49 @@ def analyze_text(text: str) -> Dict[str, int]:
 CTA_WORDS = {"share","comment","debate","join","drop","vote","duet","stitch","tag","follow","watch","reply","discuss","weigh in","sound off"}
 HOOK_WORDS = {"why","what","how","truth","myth","secret","real","let’s","is it","can we","would you","should we"}
 
+_EMOJI_RE = re.compile(r"[\U0001F300-\U0001FAFF]")
+_CAPS_RE  = re.compile(r"\b[A-Z]{3,}\b")
+
+def _vocab_alt(words) -> str:
+    # Longest-first so multi-word phrases win over their leading word.
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+# Both vocabularies fused into one word-boundary alternation, same shape as
+# _SCORE_RE: a single pass over the lowered text covers words and phrases
+# alike, with distinct matched terms counted per category.
+_VOCAB_RE = re.compile(
+    r"\b(?:(?P<hook>" + _vocab_alt(HOOK_WORDS) + r")|(?P<cta>" + _vocab_alt(CTA_WORDS) + r"))\b",
+    re.IGNORECASE,
+)
+
 def virality_label(score:int)->str:
     if score >= 80: return "🔥 High"
     if score >= 60: return "✨ Medium"
     return "🧊 Low"
 
+@st.cache_data(max_entries=1024, show_spinner=False)
 def virality_rating(text:str, tox:int=None, dis:int=None) -> Dict[str,Any]:
-    t = text.strip(); tl = t.lower(); length = len(t)
+    t = text.strip(); length = len(t)
     has_q = "?" in t
-    hook_hits = sum(1 for w in HOOK_WORDS if w in tl)
-    cta_hits  = sum(1 for w in CTA_WORDS if w in tl)
-    emoji_hits = len(re.findall(r"[\U0001F300-\U0001FAFF]", t))
+    hooks, ctas = set(), set()
+    for m in _VOCAB_RE.finditer(t):
+        (hooks if m.lastgroup == "hook" else ctas).add(m.group().lower())
+    hook_hits, cta_hits = len(hooks), len(ctas)
+    emoji_hits = sum(1 for _ in _EMOJI_RE.finditer(t))
     lines = max(1, t.count("\n")+1)
-    caps_words = len(re.findall(r"\b[A-Z]{3,}\b", t))
+    caps_words = sum(1 for _ in _CAPS_RE.finditer(t))
     caps_bonus = min(3, caps_words) * 3
     caps_penalty = max(0, caps_words-4) * 4
     if length < 40: len_bonus = -10
     elif length <= 240: len_bonus = 12
     elif length <= 500: len_bonus = 6
     else: len_bonus = -8
-    avg_words_line = sum(len(l.split()) for l in t.split("\n")) / lines
+    avg_words_line = len(t.split()) / lines
     clarity = 12 if avg_words_line <= 16 else (6 if avg_words_line <= 22 else -6)
-    if dis is None: dis = analyze_text(text)["disruption"]
-    if tox is None: tox = analyze_text(text)["toxicity"]
+    if dis is None or tox is None:
+        scores = analyze_text(text)
+        if dis is None: dis = scores["disruption"]
+        if tox is None: tox = scores["toxicity"]
     spice = 10 if 20 <= dis <= 60 else (4 if 60 < dis <= 80 else (-10 if dis > 80 else 0))
     tox_penalty = -min(30, tox // 2)
     line_bonus = 6 if 2 <= lines <= 5 else (0 if lines == 1 else -4)
@@ -173,100 +279,348 @@ def virality_rating(text:str, tox:int=None, dis:int=None) -> Dict[str,Any]:
     if caps_penalty: reasons.append("too many ALL CAPS")
     return {"score": score, "label": virality_label(score), "reasons": reasons}
 
-# --------------------------- OPENAI RECODE ---------------------------
-def _strip_code_fences(s: str) -> str:
-    m = re.search(r"```(?:json)?\s*(.*?)```", s, flags=re.S | re.I)
-    return m.group(1).strip() if m else s.strip()
-
-def generate_recodes(original: str, n_variants: int = 4) -> List[Dict[str,str]]:
-    if not client:
-        st.error("Missing `OPENAI_API_KEY`. Add it to Environment (or switch to 'Style My Original').")
-        st.stop()
+def analyze_and_rate(text: str):
+    """(scores, virality) with the analyzer result fed into the rating, so the
+    pair is one cached analysis instead of two independent ones."""
+    scores = analyze_text(text)
+    return scores, virality_rating(text, tox=scores["toxicity"], dis=scores["disruption"])
 
-    input_len = len(original)
-    target_len = input_len
-    low = original.lower()
-    if re.search(r"\b(short|shorten|condense)\b", low):
-        target_len = max(200, int(input_len*0.6))
-    elif re.search(r"\b(long|expand|detailed|thread)\b", low):
-        target_len = int(input_len*1.5)
-
-    system = f"""
+# --------------------------- OPENAI RECODE ---------------------------
+# Static system prefix — byte-identical on every call so OpenAI's automatic
+# prompt caching can reuse it server-side. Anything per-request (target
+# length, variant count, the prompt itself) rides in the user message.
+RECODE_SYSTEM_STATIC = """
 You are "Prompt Recode 4.0 — Pro".
 Rewrite an input prompt into multiple aligned alternatives that keep the topic but remove hostility and confusion.
 
 Rules:
 - Keep the cultural voice; do NOT punch down.
-- Auto-match output length to the input (~{target_len} chars) unless the input says to shorten/expand.
-- Output JSON ONLY: a list of objects with keys: style, emoji, text.
+- Match the target length given in the request unless the input says to shorten/expand.
+- Output JSON ONLY: an object with a "variants" list of objects with keys: style, emoji, text.
 - Styles to include at least once: "Serious & Balanced", "Collaborative Debate", "Comedic Spin", "Uplifting Alternative".
 - Each 'text' must be one paragraph, ready to copy/paste.
+
+Style guide:
+- Serious & Balanced: even-handed framing that names the strongest point on each side.
+- Collaborative Debate: invites disagreement as a shared project, not a fight.
+- Comedic Spin: playful, self-aware humor that never targets a group.
+- Uplifting Alternative: reframes the tension toward a constructive or hopeful angle.
+- Educational Insight: adds one concrete fact or definition that raises the discussion.
+- Thought-Provoking: ends on an open question the audience can answer from experience.
 """
-    user = f"Original prompt:\n{original}\n\nReturn a JSON list with {n_variants}–6 alternatives."
 
-    try:
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role":"system","content":system},{"role":"user","content":user}],
-            temperature=0.7,
-            max_tokens=max(1200, target_len*2)
-        )
-        content = _strip_code_fences(resp.choices[0].message.content or "")
-    except Exception:
-        st.error("Authentication failed. Verify `OPENAI_API_KEY` and redeploy.")
-        st.stop()
+# Structured-output schema: with strict=True the API guarantees valid JSON of
+# exactly this shape, so no defensive re-parsing is needed downstream.
+RECODE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "variants": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "style": {"type": "string", "enum": list(EMOJI_MAP)},
+                    "emoji": {"type": "string"},
+                    "text":  {"type": "string"},
+                },
+                "required": ["style", "emoji", "text"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["variants"],
+    "additionalProperties": False,
+}
+RECODE_RESPONSE_FORMAT = {"type": "json_schema",
+                          "json_schema": {"name": "recodes", "schema": RECODE_SCHEMA, "strict": True}}
+
+# Length directives the user can embed in the prompt ("make it short", …).
+_LEN_RE = re.compile(r"\b(?:(?P<short>short(?:en)?|condense)|(?P<long>long|expand|detailed|thread))\b")
+
+def _len_directive(low: str):
+    """'short', 'long', or None — one scan instead of one per directive."""
+    m = _LEN_RE.search(low)
+    return m.lastgroup if m else None
+
+def _recode_target_len(original: str, low: str) -> int:
+    input_len = len(original)
+    directive = _len_directive(low)
+    if directive == "short":
+        return max(200, int(input_len*0.6))
+    if directive == "long":
+        return int(input_len*1.5)
+    return input_len
+
+def _build_recode_messages(original: str, n_variants: int, target_len: int) -> List[Dict[str,str]]:
+    user = (f"Target length: ~{target_len} chars per alternative.\n"
+            f"Original prompt:\n{original}\n\n"
+            f"Return {n_variants}–6 alternatives.")
+    return [{"role":"system","content":RECODE_SYSTEM_STATIC},{"role":"user","content":user}]
 
+def _json_loads(s: str):
+    """orjson when available (same Rust parser dumps_pack uses), else stdlib."""
+    return orjson.loads(s) if orjson is not None else json.loads(s)
+
+def _parse_recode_variants(content: str, low: str, n_variants: int, target_len: int) -> List[Dict[str,str]]:
+    # Refusals arrive as empty content and a length-cut stream as broken JSON;
+    # both degrade to "no variants" rather than an uncaught JSONDecodeError.
     variants: List[Dict[str,str]] = []
+    if not content:
+        return variants
     try:
-        data = json.loads(content)
-        for item in data:
-            style = str(item.get("style","Recode")).strip()
-            emoji = EMOJI_MAP.get(style, item.get("emoji","✨")).strip()
-            text  = str(item.get("text","")).strip()
-            if text:
-                variants.append({"style":style, "emoji":emoji, "text":text})
+        data = _json_loads(content)
     except Exception:
-        blocks = re.split(r"\n\s*\n", content)
-        for b in blocks:
-            if not b.strip(): continue
-            m = re.match(r"\s*(.+?):\s*(.+)", b.strip(), flags=re.S)
-            if m:
-                style, text = m.group(1).strip(), m.group(2).strip()
-            else:
-                style, text = "Recode", b.strip()
-            variants.append({"style":style, "emoji":EMOJI_MAP.get(style,"✨"), "text":text})
+        return variants
+    if isinstance(data, dict):
+        data = data.get("variants") or []
+    # Nothing in the schema stops the model repeating a (style, text) pair,
+    # and the UI digests that pair into widget keys — a duplicate would abort
+    # the page with StreamlitDuplicateElementKey, so drop repeats here.
+    seen = set()
+    for item in data:
+        style = str(item.get("style","Recode")).strip()
+        emoji = EMOJI_MAP.get(style, item.get("emoji","✨")).strip()
+        text  = str(item.get("text","")).strip()
+        if text and (style, text) not in seen:
+            seen.add((style, text))
+            variants.append({"style":style, "emoji":emoji, "text":text})
 
     variants = variants[:max(n_variants, 4)]
-    hard_max = int(target_len * (1.5 if re.search(r"\b(long|expand|detailed|thread)\b", low) else 1.1)) + 40
+    hard_max = int(target_len * (1.5 if _len_directive(low) == "long" else 1.1)) + 40
     for v in variants:
         if len(v["text"]) > hard_max:
             v["text"] = v["text"][:hard_max].rstrip()
     return variants
 
+# ~3.5 chars per token for English; the prompt controls real output length,
+# the cap just needs to not truncate.
+CHARS_PER_TOKEN = 3.5
+# JSON scaffolding per variant (keys, style name, emoji, quoting/escapes).
+VARIANT_OVERHEAD_TOKENS = 48
+
+# Below these analyzer scores a prompt is considered already aligned and the
+# paid recode call is skipped (unless the user forces one).
+ALIGNED_TOX_MAX = 10
+ALIGNED_DIS_MAX = 10
+
+def _is_already_aligned(original: str) -> bool:
+    scores = analyze_text(original)
+    return scores["toxicity"] < ALIGNED_TOX_MAX and scores["disruption"] < ALIGNED_DIS_MAX
+
+def _aligned_passthrough(original: str) -> List[Dict[str,str]]:
+    return [{"style": "Already Aligned", "emoji": "✅", "text": original}]
+
+def _recode_max_tokens(n_variants: int, target_len: int) -> int:
+    # The user message asks for n_variants–6 alternatives, so budget the top
+    # of that range plus the per-variant JSON scaffolding: a cap sized for
+    # n_variants bare texts cuts a 6-variant reply mid-JSON, and strict
+    # json_schema cannot rescue an incomplete body.
+    per_variant = math.ceil(target_len / CHARS_PER_TOKEN) + VARIANT_OVERHEAD_TOKENS
+    return min(4096, max(n_variants, 6) * per_variant + 64)
+
+def _stream_variants(buf: str) -> List[Dict[str,Any]]:
+    """Pull complete {…} objects out of the in-flight variants array by
+    tracking brace depth and string state — no full-JSON parse needed while
+    the response is still streaming."""
+    out: List[Dict[str,Any]] = []
+    depth = 0
+    in_str = esc = False
+    start = None
+    for i, ch in enumerate(buf):
+        if in_str:
+            if esc: esc = False
+            elif ch == "\\": esc = True
+            elif ch == '"': in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+            if depth == 2 and start is None:
+                start = i
+        elif ch == "}":
+            depth -= 1
+            if depth == 1 and start is not None:
+                try:
+                    out.append(_json_loads(buf[start:i+1]))
+                except Exception:
+                    pass
+                start = None
+    return out
+
+def _recode_sampling(original: str, deterministic: bool):
+    """(temperature, seed) — deterministic mode pins both so caches can hit."""
+    if deterministic:
+        return 0.0, int(hashlib.blake2b(original.encode("utf-8")).hexdigest()[:8], 16)
+    return 0.7, None
+
+def _recode_cache_key(original: str, n_variants: int, target_len: int,
+                      temperature: float = 0.7, seed: int = None) -> str:
+    raw = f"{OPENAI_MODEL}|{n_variants}|{target_len}|{temperature}|{seed}|{original}"
+    return hashlib.blake2b(raw.encode("utf-8")).hexdigest()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_completion(key: str, original: str, n_variants: int, target_len: int,
+                       temperature: float = 0.7, seed: int = None,
+                       _placeholder=None) -> str:
+    # `key` folds in the model so a redeploy with a new OPENAI_MODEL misses cleanly.
+    # `_placeholder` (underscore = excluded from the cache key) gets the live feed.
+    if _disk_cache is not None:
+        cached = _disk_cache.get(key)
+        if cached is not None:
+            return cached
+
+    messages = _build_recode_messages(original, n_variants, target_len)
+    stream = client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        temperature=temperature,
+        seed=seed,
+        max_tokens=_recode_max_tokens(n_variants, target_len),
+        response_format=RECODE_RESPONSE_FORMAT,
+        stream=True
+    )
+    parts: List[str] = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if delta:
+            parts.append(delta)
+            # Only rescan when an object may have closed.
+            if _placeholder is not None and "}" in delta:
+                done = _stream_variants("".join(parts))
+                if done:
+                    latest = done[-1]
+                    style = str(latest.get("style", "…"))
+                    _placeholder.markdown(
+                        f"✍️ {len(done)} alternative{'s' if len(done) != 1 else ''} ready — "
+                        f"latest: {EMOJI_MAP.get(style, '✨')} **{style}**"
+                    )
+
+    content = "".join(parts)
+    if _disk_cache is not None and content:
+        try:
+            _json_loads(content)
+        except Exception:
+            pass  # refusal or length-truncated body — never persist it for 24h
+        else:
+            _disk_cache.set(key, content, expire=86400)
+    return content
+
+def generate_recodes(original: str, n_variants: int = 4, deterministic: bool = False,
+                     force: bool = False) -> List[Dict[str,str]]:
+    if not force and _is_already_aligned(original):
+        st.info("This prompt already reads as aligned — skipped the AI call. Tick 'Force recode' to rewrite anyway.")
+        return _aligned_passthrough(original)
+    if not client:
+        st.error("Missing `OPENAI_API_KEY`. Add it to Environment (or switch to 'Style My Original').")
+        st.stop()
+
+    low = original.lower()
+    target_len = _recode_target_len(original, low)
+    temperature, seed = _recode_sampling(original, deterministic)
+    placeholder = st.empty()
+    try:
+        content = _cached_completion(_recode_cache_key(original, n_variants, target_len, temperature, seed),
+                                     original, n_variants, target_len, temperature, seed,
+                                     _placeholder=placeholder)
+    except Exception:
+        st.error("Authentication failed. Verify `OPENAI_API_KEY` and redeploy.")
+        st.stop()
+    placeholder.empty()
+
+    variants = _parse_recode_variants(content, low, n_variants, target_len)
+    if not variants:
+        st.warning("The model returned no usable alternatives (refusal or truncated reply). Try rewording the prompt.")
+    return variants
+
+async def _generate_recodes_async(aclient, original: str, n_variants: int, sem: asyncio.Semaphore,
+                                  deterministic: bool = False, force: bool = False) -> List[Dict[str,str]]:
+    if not force and _is_already_aligned(original):
+        return _aligned_passthrough(original)
+    low = original.lower()
+    target_len = _recode_target_len(original, low)
+    temperature, seed = _recode_sampling(original, deterministic)
+    messages = _build_recode_messages(original, n_variants, target_len)
+    async with sem:
+        resp = await aclient.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            temperature=temperature,
+            seed=seed,
+            max_tokens=_recode_max_tokens(n_variants, target_len),
+            response_format=RECODE_RESPONSE_FORMAT
+        )
+    content = resp.choices[0].message.content or ""
+    return _parse_recode_variants(content, low, n_variants, target_len)
+
+def generate_recodes_batch(prompts: List[str], n_variants: int = 4, deterministic: bool = False,
+                           force: bool = False) -> List[Any]:
+    """Recode many prompts concurrently; wall-clock ≈ slowest call, not the sum."""
+    if not (AsyncOpenAI and OPENAI_API_KEY):
+        st.error("Missing `OPENAI_API_KEY`. Add it to Environment (or switch to 'Style My Original').")
+        st.stop()
+
+    # Duplicate lines are common in pasted batches — fire each unique prompt once.
+    unique = list(dict.fromkeys(prompts))
+
+    async def _run():
+        aclient = _make_async_client()
+        try:
+            sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+            return await asyncio.gather(
+                *[_generate_recodes_async(aclient, p, n_variants, sem, deterministic, force) for p in unique],
+                return_exceptions=True
+            )
+        finally:
+            await aclient.close()
+
+    by_prompt = dict(zip(unique, asyncio.run(_run())))
+    return [by_prompt[p] for p in prompts]
+
 # --------------------------- IMAGE TILE ---------------------------
+# Resolved once at import; tiles only ever use a couple of sizes, so the
+# parsed font objects are memoized instead of re-reading the TTF per render.
+_FONT_PATH = next((p for p in ["/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+                               "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+                               "/System/Library/Fonts/Supplemental/Arial Unicode.ttf"]
+                   if os.path.exists(p)), None)
+
+@functools.lru_cache(maxsize=16)
 def _load_font(size: int) -> ImageFont.FreeTypeFont:
-    for fpath in ["/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-                  "/usr/share/fonts/dejavu/DejaVuSans.ttf",
-                  "/System/Library/Fonts/Supplemental/Arial Unicode.ttf"]:
-        if os.path.exists(fpath):
-            return ImageFont.truetype(fpath, size=size)
+    if _FONT_PATH:
+        return ImageFont.truetype(_FONT_PATH, size=size)
     return ImageFont.load_default()
 
-def wrap_text_for_width(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, max_width: int) -> str:
+def wrap_text_for_width(text: str, font: ImageFont.ImageFont, max_width: int) -> str:
+    # Greedy wrap over per-word widths: each unique word is shaped once and a
+    # running sum decides the breaks, instead of re-measuring the growing line
+    # for every word (O(words²) FreeType calls).
+    space_w = font.getlength(" ")
+    word_w: Dict[str, float] = {}
     lines = []
     for raw_line in text.split("\n"):
-        words = raw_line.split(" ")
-        buf = ""
-        for w in words:
-            test = (buf + " " + w).strip()
-            if draw.textlength(test, font=font) <= max_width:
-                buf = test
+        buf: List[str] = []
+        cur = 0.0
+        for w in raw_line.split(" "):
+            if not w:
+                continue
+            ww = word_w.get(w)
+            if ww is None:
+                ww = word_w[w] = font.getlength(w)
+            test = ww if not buf else cur + space_w + ww
+            if test <= max_width or not buf:
+                buf.append(w)
+                cur = test
             else:
-                if buf: lines.append(buf)
-                buf = w
-        if buf: lines.append(buf)
+                lines.append(" ".join(buf))
+                buf = [w]
+                cur = ww
+        if buf:
+            lines.append(" ".join(buf))
     return "\n".join(lines)
 
+@st.cache_data(max_entries=128, show_spinner=False)
 def render_tile_png(text: str, width: int = 1080, padding: int = 72,
                     bg: str = "#0f172a", fg: str = "#f8fafc",
                     accent: str = "#f5c518", rounded: int = 36,
@@ -274,10 +628,13 @@ def render_tile_png(text: str, width: int = 1080, padding: int = 72,
     font_big = _load_font(72)
     font_body = _load_font(64)
 
-    img = Image.new("RGB", (width, 1), color=bg)
-    draw = ImageDraw.Draw(img)
-    text_wrapped = wrap_text_for_width(draw, text, font_body, width - 2*padding)
-    _, _, _, h = draw.multiline_textbbox((0,0), text_wrapped, font=font_body, spacing=10)
+    # Measure from font metrics alone — no throwaway Image/Draw pair needed —
+    # then allocate the real canvas exactly once.
+    spacing = 10
+    text_wrapped = wrap_text_for_width(text, font_body, width - 2*padding)
+    ascent, descent = font_body.getmetrics()
+    n_lines = text_wrapped.count("\n") + 1 if text_wrapped else 1
+    h = n_lines * (ascent + descent) + (n_lines - 1) * spacing
     height = padding*2 + h + (0 if not title_emoji else 80)
 
     img = Image.new("RGB", (width, height), color=bg)
@@ -292,25 +649,108 @@ def render_tile_png(text: str, width: int = 1080, padding: int = 72,
         pass
     draw.multiline_text((padding, y_start), text_wrapped, font=font_body, fill=fg, spacing=10)
 
+    # Quantize after drawing (not before) so the text keeps its antialiasing;
+    # bg + fg + accent plus the AA shades fit easily in an 8-bit palette, and
+    # the encoder then sees a third of the pixel data.
+    img = img.convert("P", palette=Image.ADAPTIVE)
+
     buf = io.BytesIO()
-    img.save(buf, format="PNG", optimize=True)
+    # Flat-color tiles barely benefit from zlib level 9; level 1 encodes ~5x
+    # faster for a few percent larger file, and the result is cached anyway.
+    img.save(buf, format="PNG", optimize=False, compress_level=1)
     return buf.getvalue()
 
 # --------------------------- UTIL (copy / fmt) ---------------------------
+CSV_FIELDS = ("item", "original", "style", "text", "toxicity", "disruption", "positivity", "virality")
+
+def dumps_pack(pack: Dict[str,Any]) -> bytes:
+    """Pack → pretty-printed JSON bytes; orjson skips the intermediate str."""
+    if orjson is not None:
+        return orjson.dumps(pack, option=orjson.OPT_INDENT_2)
+    return json.dumps(pack, ensure_ascii=False, indent=2).encode("utf-8")
+
+def build_csv(rows) -> bytes:
+    """Serialize an iterable of tuples (in CSV_FIELDS order) straight to bytes."""
+    buf = io.BytesIO()
+    wrapper = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    w = csv.writer(wrapper)
+    w.writerow(CSV_FIELDS)
+    w.writerows(rows)
+    wrapper.flush()
+    wrapper.detach()
+    return buf.getvalue()
+
 def copy_box(text: str, key: str, note: str = "Copy-ready text"):
+    # st.code ships its own clipboard button, so no per-box component iframe.
+    # `key` is kept for call-site stability even though no widget needs it now.
     st.markdown(f"**{note}**")
-    st.code(text)
-    st_html(f"""
-      <div class="copywrap">
-        <button class="copybtn" onclick="navigator.clipboard.writeText(`{text.replace('`','\\`')}`)">📋 Copy to Clipboard</button>
-      </div>
-    """, height=40)
+    st.code(text, language=None)
 
 def fmt_delta(n: int) -> str:
     # avoid -0% displaying
     if n == 0: return "0%"
     return f"{'+' if n>0 else ''}{n}%"
 
+# Card markup as precompiled Templates: one C-level substitute per render
+# instead of re-evaluating a large multi-line f-string for every card.
+_VARIANT_CARD_TPL = string.Template("""
+<div class="card">
+  <div style="font-size:18px;font-weight:800;margin-bottom:6px;">$emoji <b>$style</b></div>
+  <div style="white-space:pre-wrap;line-height:1.45;margin:6px 0 10px 0;">$text</div>
+  $metrics
+  <div style="margin-top:6px; font-size:14px; opacity:.9;"><b>Why:</b> $reasons</div>
+  <div class="metric" style="margin-top:8px;">
+    <div class="pill">✅ Toxicity reduced: <b>$tox_drop</b></div>
+    <div class="pill">✅ Disruption reduced: <b>$dis_drop</b></div>
+    <div class="pill">✅ Positivity increased: <b>$pos_gain</b></div>
+  </div>
+</div>
+""")
+
+_BATCH_CARD_TPL = string.Template("""
+<div class="card">
+  <div style="font-size:18px;font-weight:800;margin-bottom:6px;">$emoji <b>$style</b></div>
+  <div style="white-space:pre-wrap;line-height:1.45;margin:6px 0 10px 0;">$text</div>
+  $metrics
+</div>
+""")
+
+_ORIG_CARD_TPL = string.Template("""
+<div class="card">
+  $metrics
+  <div style="margin-top:6px; font-size:14px; opacity:.9;"><b>Why:</b> $reasons</div>
+</div>
+""")
+
+# Shared by both preview cards; $card_style carries the dashed border the
+# variant previews use and stays empty for the original-style preview.
+_PREVIEW_CARD_TPL = string.Template("""
+<div class="card" style="$card_style">
+  <div style="font-weight:800;margin-bottom:6px">Preview — $style</div>
+  <pre style="white-space:pre-wrap;font-family:inherit;margin:0">$text</pre>
+  <div class="metric" style="margin-top:8px;">
+    <div class="pill">🧲 Virality (styled): <b>$score%</b> ($label)</div>
+  </div>
+</div>
+""")
+
+def widget_key(s: str) -> str:
+    """Stable 8-byte digest for widget keys — unlike builtin hash(), identical
+    across processes and reruns (PYTHONHASHSEED randomizes hash())."""
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=8).hexdigest()
+
+def metrics_html(scores: Dict[str,int], viral: Dict[str,Any], suffix: str = "", extra: str = "") -> str:
+    """One pill row shared by the original, variant and batch cards."""
+    return (
+        '<div class="metric">'
+        f'<div class="pill">⚠️ Toxicity{suffix}: <b>{scores["toxicity"]}%</b></div>'
+        f'<div class="pill">🔥 Disruption{suffix}: <b>{scores["disruption"]}%</b></div>'
+        f'<div class="pill">🌱 Positivity{suffix}: <b>{scores["positivity"]}%</b></div>'
+        f'<div class="pill">🧲 Virality: <b>{viral["score"]}%</b> ({viral["label"]})</div>'
+        f'{extra}'
+        '</div>'
+    )
+
 # --------------------------- STATE HELPERS ---------------------------
 def init_state():
     defaults = {
@@ -320,6 +760,7 @@ def init_state():
         "recodes": None,
         "pack": None,
         "generated": False,
+        "batch_results": None,
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -330,8 +771,9 @@ init_state()
 def set_prompt(p: str):
     if p != st.session_state.orig_prompt:
         st.session_state.orig_prompt = p
-        st.session_state.orig_scores = analyze_text(p) if p.strip() else None
-        st.session_state.orig_viral = virality_rating(p) if p.strip() else None
+        scores, viral = analyze_and_rate(p) if p.strip() else (None, None)
+        st.session_state.orig_scores = scores
+        st.session_state.orig_viral = viral
         st.session_state.recodes = None
         st.session_state.pack = None
         st.session_state.generated = False
@@ -345,6 +787,10 @@ user_prompt = st.text_area("Paste a prompt/topic", value=st.session_state.orig_p
                            height=180, placeholder="e.g. WHY DO WE NEED APPROVAL TO WIN?")
 set_prompt(user_prompt)
 include_comedy = st.checkbox("Include a playful/comedic alternative (recode mode)", value=True)
+deterministic = st.sidebar.toggle(
+    "Deterministic mode", value=False,
+    help="Pin temperature to 0 and seed by prompt so identical inputs return identical, cacheable recodes."
+)
 
 # Original analysis
 if st.session_state.orig_scores:
@@ -352,20 +798,10 @@ if st.session_state.orig_scores:
     v = st.session_state.orig_viral
     st.markdown("### 🔍 Original Analysis")
     st.markdown(
-        f"""
-        <div class="card">
-          <div class="metric">
-            <div class="pill">⚠️ Toxicity: <b>{o['toxicity']}%</b></div>
-            <div class="pill">🔥 Disruption: <b>{o['disruption']}%</b></div>
-            <div class="pill">🌱 Positivity Potential: <b>{o['positivity']}%</b></div>
-            <div class="pill">🧲 Virality: <b>{v['score']}%</b> ({v['label']})</div>
-            <div class="pill">🔠 Length: <b>{o['length']}</b> chars</div>
-          </div>
-          <div style="margin-top:6px; font-size:14px; opacity:.9;">
-            <b>Why:</b> {" • ".join(v['reasons'])}
-          </div>
-        </div>
-        """,
+        _ORIG_CARD_TPL.substitute(
+            metrics=metrics_html(o, v, extra=f'<div class="pill">🔠 Length: <b>{o["length"]}</b> chars</div>'),
+            reasons=" • ".join(v['reasons']),
+        ),
         unsafe_allow_html=True
     )
 
@@ -373,9 +809,8 @@ if st.session_state.orig_scores:
 if mode.startswith("Style"):
     st.markdown("### 🎨 Style Your Original")
     # SAFE default indexes (no post-creation assignment to session_state keys)
-    style_options = list(STYLE_PRESETS.keys())
     default_style_index = 0
-    style_choice = st.selectbox("Choose a style preset", style_options, index=default_style_index, key="style_original")
+    style_choice = st.selectbox("Choose a style preset", _STYLE_KEYS, index=default_style_index, key="style_original")
     theme_choice = st.selectbox("PNG Theme", ["Dark (punchy)", "Light (clean)"], index=0, key="theme_original")
 
     if st.session_state.orig_prompt.strip():
@@ -383,15 +818,13 @@ if mode.startswith("Style"):
         viral_styled = virality_rating(styled)
 
         st.markdown(
-            f"""
-            <div class='card'>
-              <div style='font-weight:800;margin-bottom:6px'>Preview — {style_choice}</div>
-              <pre style='white-space:pre-wrap;font-family:inherit;margin:0'>{styled}</pre>
-              <div class="metric" style="margin-top:8px;">
-                <div class="pill">🧲 Virality (styled): <b>{viral_styled['score']}%</b> ({viral_styled['label']})</div>
-              </div>
-            </div>
-            """,
+            _PREVIEW_CARD_TPL.substitute(
+                card_style="",
+                style=style_choice,
+                text=styled,
+                score=viral_styled['score'],
+                label=viral_styled['label'],
+            ),
             unsafe_allow_html=True
         )
 
@@ -407,12 +840,15 @@ if mode.startswith("Style"):
 # ---- RECODE THEN STYLE ----
 else:
     n_variants = 4 if include_comedy else 3
+    force_recode = st.checkbox("Force recode even if the prompt already looks aligned",
+                               value=False, key="force_recode")
     if st.button("Recode it ✨", type="primary", key="recode_btn"):
         if not st.session_state.orig_prompt.strip():
             st.error("Please paste a prompt or topic.")
         else:
             with st.spinner("Generating alternatives…"):
-                recs = generate_recodes(st.session_state.orig_prompt, n_variants=n_variants)
+                recs = generate_recodes(st.session_state.orig_prompt, n_variants=n_variants,
+                                        deterministic=deterministic, force=force_recode)
             st.session_state.recodes = recs
             st.session_state.pack = {
                 "original": {"text": st.session_state.orig_prompt,
@@ -422,118 +858,167 @@ else:
             }
             st.session_state.generated = True
 
-    if st.session_state.generated and st.session_state.recodes:
-        st.markdown("### ✨ Alternatives (pick a style, copy, export)")
-        style_options = list(STYLE_PRESETS.keys())
-
-        for idx, rec in enumerate(st.session_state.recodes):
-            now = analyze_text(rec["text"])
-            tox_drop = max(0, st.session_state.orig_scores['toxicity'] - now['toxicity'])
-            dis_drop = max(0, st.session_state.orig_scores['disruption'] - now['disruption'])
-            pos_gain = max(0, now['positivity'] - st.session_state.orig_scores['positivity'])
-            viral = virality_rating(rec["text"], tox=now["toxicity"], dis=now["disruption"])
-
-            st.markdown(
-                f"""
-                <div class="card">
-                  <div style="font-size:18px;font-weight:800;margin-bottom:6px;">
-                    {EMOJI_MAP.get(rec['style'], rec['emoji'])} <b>{rec['style']}</b>
-                  </div>
-                  <div style="white-space:pre-wrap;line-height:1.45;margin:6px 0 10px 0;">{rec['text']}</div>
-                  <div class="metric">
-                    <div class="pill">⚠️ Toxicity now: <b>{now['toxicity']}%</b></div>
-                    <div class="pill">🔥 Disruption now: <b>{now['disruption']}%</b></div>
-                    <div class="pill">🌱 Positivity now: <b>{now['positivity']}%</b></div>
-                    <div class="pill">🧲 Virality: <b>{viral['score']}%</b> ({viral['label']})</div>
-                  </div>
-                  <div style="margin-top:6px; font-size:14px; opacity:.9;">
-                    <b>Why:</b> {" • ".join(viral['reasons'])}
-                  </div>
-                  <div class="metric" style="margin-top:8px;">
-                    <div class="pill">✅ Toxicity reduced: <b>{fmt_delta(tox_drop)}</b></div>
-                    <div class="pill">✅ Disruption reduced: <b>{fmt_delta(dis_drop)}</b></div>
-                    <div class="pill">✅ Positivity increased: <b>{fmt_delta(pos_gain)}</b></div>
-                  </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    @st.fragment
+    def _variant_card(rec):
+        # A fragment reruns alone when one of its own widgets changes, so
+        # picking a style or theme on one card no longer re-renders (and
+        # re-rasterizes tiles for) every other card on the page.
+        now, viral = analyze_and_rate(rec["text"])
+        tox_drop = max(0, st.session_state.orig_scores['toxicity'] - now['toxicity'])
+        dis_drop = max(0, st.session_state.orig_scores['disruption'] - now['disruption'])
+        pos_gain = max(0, now['positivity'] - st.session_state.orig_scores['positivity'])
 
-            # SAFE defaults for widgets — no manual session_state writes after creation
-            style_default_index = 0
-            theme_default_index = 0
-            style_key = f"style_{idx}"
-            theme_key = f"theme_{idx}"
-
-            style_choice = st.selectbox(
-                f"Style for: {rec['style']}",
-                style_options,
-                index=style_default_index,
-                key=style_key
-            )
-            theme_choice = st.selectbox(
-                "PNG Theme",
-                ["Dark (punchy)", "Light (clean)"],
-                index=theme_default_index,
-                key=theme_key
-            )
+        st.markdown(
+            _VARIANT_CARD_TPL.substitute(
+                emoji=rec["emoji"],
+                style=rec['style'],
+                text=rec['text'],
+                metrics=metrics_html(now, viral, suffix=" now"),
+                reasons=" • ".join(viral['reasons']),
+                tox_drop=fmt_delta(tox_drop),
+                dis_drop=fmt_delta(dis_drop),
+                pos_gain=fmt_delta(pos_gain),
+            ),
+            unsafe_allow_html=True
+        )
 
-            styled_text = format_prompt_for_style(rec["text"], style_choice)
-            viral_styled = virality_rating(styled_text)
-
-            st.markdown(
-                f"""
-                <div class='card' style='background:#fff;border:1px dashed #ccc;'>
-                  <div style='font-weight:800;margin-bottom:6px'>Preview — {style_choice}</div>
-                  <pre style='white-space:pre-wrap;font-family:inherit;margin:0'>{styled_text}</pre>
-                  <div class="metric" style="margin-top:8px;">
-                    <div class="pill">🧲 Virality (styled): <b>{viral_styled['score']}%</b> ({viral_styled['label']})</div>
-                  </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+        # SAFE defaults for widgets — no manual session_state writes after creation.
+        # Keys digest the variant content so widget state follows the variant
+        # even if the recode list is regenerated in a different order.
+        rec_key = widget_key(rec["style"] + rec["text"])
+        style_choice = st.selectbox(
+            f"Style for: {rec['style']}",
+            _STYLE_KEYS,
+            index=0,
+            key=f"style_{rec_key}"
+        )
+        theme_choice = st.selectbox(
+            "PNG Theme",
+            ["Dark (punchy)", "Light (clean)"],
+            index=0,
+            key=f"theme_{rec_key}"
+        )
+
+        # The JSON pack lives in the app body, which a fragment-only rerun
+        # skips — escalate style changes to a full rerun so its download never
+        # serves bytes built from a previous selection. Theme stays
+        # fragment-local: it only affects this card's PNG, not the pack.
+        prev_key = f"prevstyle_{rec_key}"
+        if st.session_state.get(prev_key) != style_choice:
+            seen_before = prev_key in st.session_state
+            st.session_state[prev_key] = style_choice
+            if seen_before:
+                st.rerun(scope="app")
 
-            copy_box(styled_text, key=f"copy_{idx}", note="Copy-ready prompt")
+        styled_text = format_prompt_for_style(rec["text"], style_choice)
+        viral_styled = virality_rating(styled_text)
 
-            bg = "#0f172a" if theme_choice.startswith("Dark") else "#ffffff"
-            fg = "#f8fafc" if theme_choice.startswith("Dark") else "#111111"
-            png_bytes = render_tile_png(styled_text, bg=bg, fg=fg, title_emoji="")
-            st.download_button("📄 Download TXT", data=styled_text,
-                               file_name=f"{rec['style'].replace(' ','_').lower()}_{style_choice.replace(' ','_').lower()}.txt",
-                               mime="text/plain", key=f"txt_{idx}")
-            st.download_button("🖼️ Download PNG Tile", data=png_bytes,
-                               file_name=f"{rec['style'].replace(' ','_').lower()}_{style_choice.replace(' ','_').lower()}.png",
-                               mime="image/png", key=f"png_{idx}")
+        st.markdown(
+            _PREVIEW_CARD_TPL.substitute(
+                card_style="background:#fff;border:1px dashed #ccc;",
+                style=style_choice,
+                text=styled_text,
+                score=viral_styled['score'],
+                label=viral_styled['label'],
+            ),
+            unsafe_allow_html=True
+        )
+
+        copy_box(styled_text, key=f"copy_{rec_key}", note="Copy-ready prompt")
+
+        bg = "#0f172a" if theme_choice.startswith("Dark") else "#ffffff"
+        fg = "#f8fafc" if theme_choice.startswith("Dark") else "#111111"
+        png_bytes = render_tile_png(styled_text, bg=bg, fg=fg, title_emoji="")
+        st.download_button("📄 Download TXT", data=styled_text,
+                           file_name=f"{rec['style'].replace(' ','_').lower()}_{style_choice.replace(' ','_').lower()}.txt",
+                           mime="text/plain", key=f"txt_{rec_key}")
+        st.download_button("🖼️ Download PNG Tile", data=png_bytes,
+                           file_name=f"{rec['style'].replace(' ','_').lower()}_{style_choice.replace(' ','_').lower()}.png",
+                           mime="image/png", key=f"png_{rec_key}")
 
-        # Pack (optional JSON)
+    if st.session_state.generated and st.session_state.recodes:
+        st.markdown("### ✨ Alternatives (pick a style, copy, export)")
+        for rec in st.session_state.recodes:
+            _variant_card(rec)
+
+        # Pack (optional JSON). Rebuilt from the widget state in session_state
+        # rather than values threaded out of the fragments — everything here is
+        # a cache hit. _variant_card escalates style changes to a full rerun,
+        # so this body is never left serving a pack built from old selections.
         pack = {
             "original": {"text": st.session_state.orig_prompt,
                          "scores": st.session_state.orig_scores,
                          "virality": st.session_state.orig_viral},
             "alternatives": []
         }
-        for idx, rec in enumerate(st.session_state.recodes):
-            chosen_style = st.session_state.get(f"style_{idx}", list(STYLE_PRESETS.keys())[0])
+        for rec in st.session_state.recodes:
+            rec_key = widget_key(rec["style"] + rec["text"])
+            chosen_style = st.session_state.get(f"style_{rec_key}", _STYLE_KEYS[0])
+            now, viral = analyze_and_rate(rec["text"])
             styled_text = format_prompt_for_style(rec["text"], chosen_style)
             pack["alternatives"].append({
                 "style": rec["style"],
-                "emoji": EMOJI_MAP.get(rec["style"], rec["emoji"]),
+                "emoji": rec["emoji"],
                 "raw_text": rec["text"],
                 "styled_choice": chosen_style,
                 "styled_text": styled_text,
-                "scores": analyze_text(rec["text"]),
-                "virality": virality_rating(rec["text"]),
+                "scores": now,
+                "virality": viral,
                 "virality_styled": virality_rating(styled_text)
             })
 
         st.download_button(
             "⬇️ Download JSON pack",
-            data=json.dumps(pack, ensure_ascii=False, indent=2).encode("utf-8"),
+            data=dumps_pack(pack),
             file_name="prompt_recode_pack.json",
             mime="application/json",
             key="pack_dl"
         )
 
+    # ---- BATCH MODE ----
+    st.markdown("### 📦 Batch Mode")
+    batch_text = st.text_area("One prompt per line", height=140, key="batch_input",
+                              placeholder="Paste several prompts, one per line…")
+    if st.button("Recode them all ✨", key="batch_btn"):
+        prompts = [l.strip() for l in batch_text.splitlines() if l.strip()]
+        if not prompts:
+            st.error("Add at least one prompt (one per line).")
+        else:
+            with st.spinner(f"Recoding {len(prompts)} prompts in parallel…"):
+                results = generate_recodes_batch(prompts, n_variants=n_variants,
+                                                 deterministic=deterministic, force=force_recode)
+            st.session_state.batch_results = list(zip(prompts, results))
+
+    if st.session_state.batch_results:
+        csv_rows = []
+        for i, (prompt, recs) in enumerate(st.session_state.batch_results):
+            with st.expander(f"Item {i+1} — {prompt[:60]}", expanded=(i == 0)):
+                st.markdown(f"**Original:** {prompt}")
+                if isinstance(recs, Exception):
+                    st.error("Recode failed for this prompt. Verify `OPENAI_API_KEY` and retry.")
+                    continue
+                for rec in recs:
+                    now, viral = analyze_and_rate(rec["text"])
+                    csv_rows.append((i+1, prompt, rec["style"], rec["text"],
+                                     now["toxicity"], now["disruption"], now["positivity"], viral["score"]))
+                    st.markdown(
+                        _BATCH_CARD_TPL.substitute(
+                            emoji=rec["emoji"],
+                            style=rec['style'],
+                            text=rec['text'],
+                            metrics=metrics_html(now, viral, suffix=" now"),
+                        ),
+                        unsafe_allow_html=True
+                    )
+
+        if csv_rows:
+            st.download_button(
+                "⬇️ Download batch CSV",
+                data=build_csv(csv_rows),
+                file_name="prompt_recode_batch.csv",
+                mime="text/csv",
+                key="batch_csv_dl"
+            )
+
 st.markdown("---")
 st.caption("© 2025 Prompt Styler + Recode 4.0 — Pro")